@@ -0,0 +1,294 @@
+import os
+import stat
+import zlib
+import mimetypes
+import logging
+from email.utils import formatdate
+from typing import List, Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，未安装时只提供 gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# 每次读取/发送的块大小
+CHUNK_SIZE = 64 * 1024
+# 可以在线压缩的文本输出格式
+COMPRESSIBLE_EXTENSIONS = {'md', 'html', 'txt'}
+# 小于该大小的文件不值得压缩
+MIN_COMPRESS_SIZE = 1024
+# 在线压缩使用较快的压缩级别（brotli默认11级只适合离线压缩）
+BROTLI_QUALITY = 5
+GZIP_LEVEL = 5
+# 允许浏览器和CDN缓存，但每次使用前需用ETag重新验证
+CACHE_CONTROL = "public, max-age=0, must-revalidate"
+
+mimetypes.add_type('text/markdown', '.md')
+mimetypes.add_type('application/epub+zip', '.epub')
+
+
+class RangeNotSatisfiable(Exception):
+    """Range请求超出文件范围"""
+
+
+def resolve_download_path(base_dir: str, filename: str) -> Optional[str]:
+    """
+    在base_dir内安全地解析下载文件路径，非法或不存在时返回None
+    """
+    if not filename or '\x00' in filename:
+        return None
+    # 只允许纯文件名，拒绝任何目录成分
+    if filename != os.path.basename(filename) or filename in ('.', '..') or '\\' in filename:
+        return None
+
+    base = os.path.realpath(base_dir)
+    path = os.path.realpath(os.path.join(base, filename))
+    # 防止通过符号链接逃逸出下载目录
+    if os.path.commonpath([base, path]) != base:
+        return None
+    if not os.path.isfile(path):
+        return None
+    return path
+
+
+def make_etag(stat_result: os.stat_result) -> str:
+    """
+    根据修改时间和文件大小生成强ETag
+    """
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def _etag_list(header: str) -> List[str]:
+    # 比较时忽略弱校验前缀（RFC 7232 弱比较）
+    tags = []
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag:
+            tags.append(tag)
+    return tags
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单个 bytes Range，返回闭区间 (start, end)；
+    无法识别或包含多个区间时返回None（按完整文件响应）
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, sep, last = spec.strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if first == '':
+            # 后缀区间：最后N个字节
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable()
+            start = max(size - length, 0)
+            end = size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else size - 1
+            if end < start:
+                return None
+            end = min(end, size - 1)
+    except ValueError:
+        return None
+
+    if start >= size or start < 0:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    根据Accept-Encoding选择压缩方式，优先brotli
+    """
+    accepted = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+
+    candidates = ['br', 'gzip'] if brotli is not None else ['gzip']
+    for encoding in candidates:
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+
+def _content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+class DownloadResponse(Response):
+    """
+    下载响应：支持Range分段和在线压缩，文件内容分块流式发送
+    """
+
+    def __init__(
+        self,
+        path: str,
+        status_code: int,
+        headers: dict,
+        start: int = 0,
+        end: int = -1,
+        encoding: Optional[str] = None,
+        send_body: bool = True,
+    ):
+        self.path = path
+        self.status_code = status_code
+        self.start = start
+        self.end = end
+        self.encoding = encoding
+        self.send_body = send_body
+        self.background = None
+        self.init_headers(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        if not self.send_body or self.end < self.start:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if self.encoding:
+            await self._send_compressed(send)
+        else:
+            await self._send_chunks(send)
+
+    async def _send_chunks(self, send: Send) -> None:
+        remaining = self.end - self.start + 1
+        async with await anyio.open_file(self.path, 'rb') as file:
+            await file.seek(self.start)
+            while remaining > 0:
+                chunk = await file.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": remaining > 0,
+                })
+        if remaining > 0:
+            # 文件在发送过程中被截断
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def _send_compressed(self, send: Send) -> None:
+        if self.encoding == 'br':
+            compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            compress, flush = compressor.process, compressor.finish
+        else:
+            compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+            compress, flush = compressor.compress, compressor.flush
+
+        async with await anyio.open_file(self.path, 'rb') as file:
+            while True:
+                chunk = await file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                # 压缩放到线程中执行，避免阻塞事件循环
+                data = await anyio.to_thread.run_sync(compress, chunk)
+                if data:
+                    await send({"type": "http.response.body", "body": data, "more_body": True})
+        data = await anyio.to_thread.run_sync(flush)
+        await send({"type": "http.response.body", "body": data, "more_body": False})
+
+
+def build_download_response(request: Request, path: str, filename: str) -> Response:
+    """
+    根据请求头构建下载响应：ETag/If-None-Match、If-Range、Range和压缩协商
+    """
+    stat_result = os.stat(path)
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise FileNotFoundError(path)
+
+    size = stat_result.st_size
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    media_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    if media_type.startswith('text/'):
+        media_type += '; charset=utf-8'
+
+    etag = make_etag(stat_result)
+    last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+    range_header = request.headers.get('range')
+
+    # Range请求始终返回原始字节，压缩只用于完整文件
+    encoding = None
+    compressible = extension in COMPRESSIBLE_EXTENSIONS
+    if compressible and not range_header and size >= MIN_COMPRESS_SIZE:
+        encoding = choose_encoding(request.headers.get('accept-encoding', ''))
+    if encoding:
+        # 不同编码的表示需要不同的ETag
+        etag = f'{etag[:-1]}-{encoding}"'
+
+    headers = {
+        'accept-ranges': 'bytes',
+        'etag': etag,
+        'last-modified': last_modified,
+        'cache-control': CACHE_CONTROL,
+        'content-type': media_type,
+        'content-disposition': _content_disposition(filename),
+    }
+    if compressible:
+        headers['vary'] = 'Accept-Encoding'
+
+    send_body = request.method != 'HEAD'
+
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match and (if_none_match.strip() == '*' or etag in _etag_list(if_none_match)):
+        del headers['content-type']
+        del headers['content-disposition']
+        return DownloadResponse(path, 304, headers, send_body=False)
+
+    if range_header:
+        if_range = request.headers.get('if-range')
+        if if_range and if_range.strip() not in (etag, last_modified):
+            # 文件已变化，If-Range不匹配时返回完整文件
+            range_header = None
+
+    if range_header:
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            headers['content-range'] = f'bytes */{size}'
+            headers['content-length'] = '0'
+            del headers['content-disposition']
+            return DownloadResponse(path, 416, headers, send_body=False)
+
+        if byte_range is not None:
+            start, end = byte_range
+            headers['content-range'] = f'bytes {start}-{end}/{size}'
+            headers['content-length'] = str(end - start + 1)
+            logger.info(f"Range下载: {filename} bytes {start}-{end}/{size}")
+            return DownloadResponse(path, 206, headers, start, end, send_body=send_body)
+
+    if encoding:
+        headers['content-encoding'] = encoding
+    else:
+        headers['content-length'] = str(size)
+    return DownloadResponse(path, 200, headers, 0, size - 1, encoding, send_body)
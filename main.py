@@ -1,5 +1,6 @@
 from fastapi import FastAPI, UploadFile, HTTPException, Request, Form
-from fastapi.responses import JSONResponse, FileResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import httpx
@@ -8,6 +9,8 @@ import logging
 from logging.handlers import RotatingFileHandler
 from typing import Optional
 from utils import process_file, save_translated_file, convert_pdf_to_markdown
+from download import resolve_download_path, build_download_response
+from model_scheduler import ModelScheduler, OLLAMA_KEEP_ALIVE
 import re
 import asyncio
 import json
@@ -64,6 +67,13 @@ templates = Jinja2Templates(directory="templates")
 
 OLLAMA_BASE_URL = "http://localhost:11434"
 
+# 按模型分组调度翻译请求，并保持模型常驻
+model_scheduler = ModelScheduler(OLLAMA_BASE_URL)
+
+@app.on_event("shutdown")
+async def shutdown_scheduler():
+    await model_scheduler.close()
+
 # 获取可用的Ollama模型列表
 async def get_available_models() -> List[str]:
     try:
@@ -164,7 +174,8 @@ async def translate_chunk(client: httpx.AsyncClient, text: str, source_lang: str
         json={
             "model": model,
             "prompt": prompt,
-            "stream": False
+            "stream": False,
+            "keep_alive": OLLAMA_KEEP_ALIVE
         },
         timeout=120.0
     )
@@ -217,6 +228,11 @@ async def translate_file(
                 detail=f"不支持的文件类型。支持的类型有: {', '.join(supported_extensions)}"
             )
         
+        # 验证翻译参数，参数不完整时不预热模型
+        if need_translate:
+            if not all([source_lang, target_lang, model]):
+                raise HTTPException(status_code=422, detail="翻译需要提供源语言、目标语言和模型")
+        
         # 保存上传的文件
         file_path = os.path.join(UPLOAD_DIR, file.filename)
         logger.info(f"上传文件保存路径: {file_path}")
@@ -225,11 +241,15 @@ async def translate_file(
             content = await file.read()
             buffer.write(content)
         
+        # 任务已接受，在解析文件的同时预加载模型
+        if need_translate:
+            model_scheduler.warm_up(model)
+        
         # 如果是PDF转Markdown，直接使用convert_pdf_to_markdown
         if file_extension == 'pdf' and output_format == 'markdown':
             try:
                 logger.info(f"开始将PDF转换为Markdown: {file.filename}")
-                text = convert_pdf_to_markdown(file_path)
+                text = await run_in_threadpool(convert_pdf_to_markdown, file_path)
                 logger.info(f"PDF转换为Markdown成功: {file.filename}")
             except Exception as e:
                 logger.error(f"PDF转Markdown失败: {str(e)}")
@@ -238,7 +258,7 @@ async def translate_file(
             # 处理其他文件内容
             try:
                 logger.info(f"开始处理文件: {file.filename}")
-                text = process_file(file_path, file_extension)
+                text = await run_in_threadpool(process_file, file_path, file_extension)
                 logger.info(f"文件处理成功: {file.filename}")
             except Exception as e:
                 logger.error(f"文件处理失败: {str(e)}")
@@ -246,38 +266,23 @@ async def translate_file(
         
         # 如果需要翻译
         if need_translate:
-            if not all([source_lang, target_lang, model]):
-                raise HTTPException(status_code=422, detail="翻译需要提供源语言、目标语言和模型")
-                
             # 准备翻译请求
             chunks = split_text_into_chunks(text)
-            translated_chunks = []
             
-            # 翻译每个文本块
-            async with httpx.AsyncClient() as client:
-                for chunk in chunks:
-                    prompt = f"Please translate the following text from {source_lang} to {target_lang}. Maintain any special formatting or technical terms:\n\n{chunk}"
-                    
-                    try:
-                        response = await client.post(
-                            f"{OLLAMA_BASE_URL}/api/generate",
-                            json={
-                                "model": model,
-                                "prompt": prompt,
-                                "stream": False
-                            },
-                            timeout=300.0
-                        )
-                        
-                        if response.status_code == 200:
-                            result = response.json()
-                            translated_text = result.get('response', '').strip()
-                            translated_chunks.append(translated_text)
-                        else:
-                            raise HTTPException(status_code=500, detail=f"翻译服务错误: {response.text}")
-                            
-                    except Exception as e:
-                        raise HTTPException(status_code=500, detail=f"翻译请求失败: {str(e)}")
+            # 一次性提交所有文本块，由调度器与同模型的其他任务合并执行
+            futures = [
+                model_scheduler.submit(
+                    model,
+                    f"Please translate the following text from {source_lang} to {target_lang}. Maintain any special formatting or technical terms:\n\n{chunk}"
+                )
+                for chunk in chunks
+            ]
+            try:
+                translated_chunks = await asyncio.gather(*futures)
+            except Exception as e:
+                for future in futures:
+                    future.cancel()
+                raise HTTPException(status_code=500, detail=f"翻译请求失败: {str(e)}")
             
             # 使用翻译后的文本
             final_text = "\n\n".join(translated_chunks)
@@ -319,16 +324,15 @@ async def translate_file(
         logger.error(f"处理过程发生错误: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/download/{filename}")
-async def download_file(filename: str):
-    file_path = os.path.join(TRANSLATED_DIR, filename)
-    if not os.path.exists(file_path):
+@app.api_route("/download/{filename}", methods=["GET", "HEAD"])
+async def download_file(request: Request, filename: str):
+    file_path = resolve_download_path(TRANSLATED_DIR, filename)
+    if file_path is None:
+        raise HTTPException(status_code=404, detail="文件未找到")
+    try:
+        return build_download_response(request, file_path, filename)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="文件未找到")
-    return FileResponse(
-        file_path,
-        filename=filename,
-        media_type='application/octet-stream'
-    )
 
 @app.get("/health")
 async def health_check():
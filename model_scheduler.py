@@ -0,0 +1,231 @@
+import os
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional, Set, Tuple, Union
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+def parse_keep_alive(value: str) -> Union[int, str]:
+    """
+    解析keep_alive配置：纯数字按秒传给Ollama（负数表示常驻），否则按时长字符串（如 30m）传递
+    """
+    value = value.strip()
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+# 模型在Ollama中空闲后保持加载的时间
+OLLAMA_KEEP_ALIVE = parse_keep_alive(os.getenv('OLLAMA_KEEP_ALIVE', '30m'))
+# 同一模型连续执行的最大块数，超过后让其他模型的排队任务先执行，避免饿死
+MODEL_BATCH_LIMIT = int(os.getenv('MODEL_BATCH_LIMIT', '32'))
+# 当前模型同时发往Ollama的请求数，默认逐块执行；Ollama配置了 OLLAMA_NUM_PARALLEL 时可调大到相同值，
+# 超过该值的请求会在Ollama中排队并占用各自的超时时间
+MODEL_MAX_CONCURRENCY = int(os.getenv('MODEL_MAX_CONCURRENCY', '1'))
+
+Job = Tuple[str, asyncio.Future]
+
+
+class ModelScheduler:
+    """
+    按模型分组调度翻译块：优先连续执行当前已加载模型的块，减少Ollama反复加载/卸载模型。
+    当前模型最多同时执行 max_concurrency 个块，只有这些块全部完成后才切换到其他模型
+    """
+
+    def __init__(self, base_url: str, keep_alive: Union[int, str] = OLLAMA_KEEP_ALIVE,
+                 batch_limit: int = MODEL_BATCH_LIMIT,
+                 max_concurrency: int = MODEL_MAX_CONCURRENCY, timeout: float = 300.0):
+        self.base_url = base_url
+        self.keep_alive = keep_alive
+        self.batch_limit = max(batch_limit, 1)
+        self.max_concurrency = max(max_concurrency, 1)
+        self.timeout = timeout
+        # 模型 -> 排队中的块，按首次排队顺序排列
+        self._queues: "OrderedDict[str, Deque[Job]]" = OrderedDict()
+        self._loaded: Optional[str] = None
+        self._run_length = 0
+        self._in_flight = 0
+        self._tasks: Set[asyncio.Task] = set()
+        self._warming: Dict[str, asyncio.Task] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.base_url)
+        return self._client
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.ensure_future(self._run())
+
+    def _set_loaded(self, model: str):
+        if model != self._loaded:
+            self._loaded = model
+            self._run_length = 0
+
+    def _has_pending_for_other(self, model: str) -> bool:
+        if self._in_flight and self._loaded != model:
+            return True
+        return any(name != model and queue for name, queue in self._queues.items())
+
+    def submit(self, model: str, prompt: str) -> asyncio.Future:
+        """
+        提交一个翻译块，返回结果Future；取消Future即可放弃尚未执行的块
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(model, deque()).append((prompt, future))
+        self._ensure_worker()
+        self._wakeup.set()
+        return future
+
+    def warm_up(self, model: str):
+        """
+        在后台预加载模型；其他模型仍有任务在执行或排队时跳过，避免把它们挤出内存。
+        模型已加载时该请求开销很小，并会刷新其keep_alive
+        """
+        if not model or model in self._warming:
+            return
+        if self._has_pending_for_other(model):
+            logger.info(f"其他模型正在执行，跳过预热: {model}")
+            return
+        self._warming[model] = asyncio.ensure_future(self._warm(model))
+
+    async def _warm(self, model: str):
+        try:
+            logger.info(f"开始预热模型: {model}")
+            # 不带prompt的generate请求只加载模型
+            response = await self._get_client().post(
+                "/api/generate",
+                json={"model": model, "keep_alive": self.keep_alive},
+                timeout=self.timeout
+            )
+            if response.status_code != 200:
+                logger.warning(f"预热模型失败: {model}, {response.text}")
+                return
+            logger.info(f"模型预热完成: {model}")
+            if not self._in_flight and not self._has_pending_for_other(model):
+                self._set_loaded(model)
+        except Exception as e:
+            logger.warning(f"预热模型失败: {model}, {str(e)}")
+        finally:
+            self._warming.pop(model, None)
+
+    def _next_job(self) -> Optional[Tuple[str, str, asyncio.Future]]:
+        # 丢弃已取消的块和空队列
+        for name in list(self._queues):
+            queue = self._queues[name]
+            while queue and queue[0][1].done():
+                queue.popleft()
+            if not queue:
+                del self._queues[name]
+        if not self._queues:
+            return None
+
+        model = self._loaded
+        batch_done = (model in self._queues and self._run_length >= self.batch_limit
+                      and len(self._queues) > 1)
+        if model not in self._queues or batch_done:
+            # 切换模型前等待当前模型的在途请求全部完成
+            if self._in_flight:
+                return None
+            if batch_done:
+                # 当前模型已连续执行足够多的块，轮到排队最久的其他模型
+                self._queues.move_to_end(model)
+            model = next(iter(self._queues))
+
+        prompt, future = self._queues[model].popleft()
+        return model, prompt, future
+
+    def _fail_pending(self, error: Exception):
+        # 调度出错时让所有排队的块立即失败，避免请求无限等待
+        for queue in self._queues.values():
+            for _, future in queue:
+                if not future.done():
+                    future.set_exception(error)
+        self._queues.clear()
+        self._loaded = None
+        self._run_length = 0
+
+    async def _run(self):
+        while True:
+            job = None
+            try:
+                if self._in_flight < self.max_concurrency:
+                    job = self._next_job()
+            except Exception as e:
+                logger.error(f"模型调度失败: {str(e)}", exc_info=True)
+                self._fail_pending(RuntimeError(f"模型调度失败: {str(e)}"))
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            model, prompt, future = job
+            if model != self._loaded and self._loaded is not None:
+                logger.info(f"切换模型: {self._loaded} -> {model}")
+            self._set_loaded(model)
+            self._run_length += 1
+
+            self._in_flight += 1
+            task = asyncio.ensure_future(self._execute(model, prompt, future))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _execute(self, model: str, prompt: str, future: asyncio.Future):
+        try:
+            result = await self._generate(model, prompt)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+        finally:
+            self._in_flight -= 1
+            # 调度器被关闭时，不让等待方一直挂起
+            if not future.done():
+                future.cancel()
+            self._wakeup.set()
+
+    async def _generate(self, model: str, prompt: str) -> str:
+        response = await self._get_client().post(
+            "/api/generate",
+            json={
+                "model": model,
+                "prompt": prompt,
+                "stream": False,
+                "keep_alive": self.keep_alive
+            },
+            timeout=self.timeout
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"翻译服务错误: {response.text}")
+        result = response.json()
+        return result.get('response', '').strip()
+
+    async def close(self):
+        """
+        停止调度并关闭HTTP客户端
+        """
+        tasks = list(self._warming.values()) + list(self._tasks)
+        if self._worker is not None:
+            tasks.append(self._worker)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for queue in self._queues.values():
+            for _, future in queue:
+                future.cancel()
+        self._queues.clear()
+        self._worker = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None